@@ -1,12 +1,14 @@
 
 
-import json
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional, List
+import time
+
+import asyncpg
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Optional, List
 from datetime import datetime
 
-from funciones     import fila_a_dict, lista_a_dicts
+from funciones     import fila_a_dict, lista_a_dicts, Texto64, Texto200, Texto500
 from dependencias  import get_db
 
 router = APIRouter(
@@ -18,6 +20,37 @@ router = APIRouter(
 ESTADOS_VALIDOS = ["programada", "completada", "cancelada", "no_asistio"]
 
 
+# SELECT base de los listados: cita + datos de la mascota y el dueño
+_SELECT_CITAS = """
+    SELECT
+        c.*,
+        m.nombre   AS nombre_mascota,
+        m.especie,
+        d.nombre   AS nombre_dueno,
+        d.telefono AS telefono_dueno
+    FROM citas c
+    JOIN mascotas m ON m.id = c.mascota_id
+    JOIN duenos   d ON d.id = c.dueno_id
+"""
+
+# Variantes canónicas de los listados. Al ser strings fijos (en vez de
+# construirlos por petición), BBDD_vete las prepara UNA vez por conexión
+# del pool y los handlers reutilizan el plan ya parseado.
+CONSULTAS_CITAS = {
+    "citas_todas":          _SELECT_CITAS + " ORDER BY c.fecha_hora ASC LIMIT $1 OFFSET $2",
+    "citas_estado":         _SELECT_CITAS + " WHERE c.estado = $1 ORDER BY c.fecha_hora ASC LIMIT $2 OFFSET $3",
+    "citas_mascota":        _SELECT_CITAS + " WHERE c.mascota_id = $1 ORDER BY c.fecha_hora ASC LIMIT $2 OFFSET $3",
+    "citas_estado_mascota": _SELECT_CITAS + " WHERE c.estado = $1 AND c.mascota_id = $2 ORDER BY c.fecha_hora ASC LIMIT $3 OFFSET $4",
+    # Rango [hoy, mañana) en vez de DATE(fecha_hora) = hoy: al no envolver
+    # la columna en una función, Postgres puede usar el índice idx_citas_fecha
+    "citas_hoy":            _SELECT_CITAS + (
+        " WHERE c.fecha_hora >= CURRENT_DATE"
+        " AND c.fecha_hora < CURRENT_DATE + INTERVAL '1 day'"
+        " ORDER BY c.fecha_hora ASC"
+    ),
+}
+
+
 
 class DatosCita(BaseModel):
     """
@@ -25,104 +58,113 @@ class DatosCita(BaseModel):
     Se guarda como JSONB: flexible y extensible
     sin necesidad de alterar la estructura de la tabla.
     """
-    sintomas:             Optional[List[str]] = []          # Síntomas de la mascota
-    tratamiento:          Optional[str]       = None        # Tratamiento aplicado
-    veterinario:          Optional[str]       = None        # Nombre del veterinario
-    coste:                Optional[float]     = None        # Precio en euros
-    pago:                 Optional[str]       = "pendiente" # pendiente | pagado | parcial
-    requiere_seguimiento: Optional[bool]      = False       # Si hay revisión posterior
+    # defer_build=False: compilar el validador al importar, no en la 1ª petición
+    # extra="forbid": rechazar campos desconocidos en vez de ignorarlos
+    model_config = ConfigDict(defer_build=False, extra="forbid")
+
+    sintomas:             Optional[List[Texto64]] = Field([], max_length=32)  # Síntomas de la mascota
+    tratamiento:          Optional[Texto500]      = None        # Tratamiento aplicado
+    veterinario:          Optional[Texto200]      = None        # Nombre del veterinario
+    coste:                Optional[float]         = None        # Precio en euros
+    pago:                 Optional[Texto64]       = "pendiente" # pendiente | pagado | parcial
+    requiere_seguimiento: Optional[bool]          = False       # Si hay revisión posterior
 
 
 class CrearCita(BaseModel):
     """Datos necesarios para crear una cita."""
+    model_config = ConfigDict(defer_build=False, extra="forbid")
+
     mascota_id: int
     dueno_id:   int
-    fecha_hora: datetime           # Ej: "2025-03-15T10:30:00"
-    motivo:     str
-    notas:      Optional[str]  = None
-    datos_cita: DatosCita      = DatosCita()
+    fecha_hora: datetime               # Ej: "2025-03-15T10:30:00"
+    motivo:     Texto500
+    notas:      Optional[Texto500] = None
+    datos_cita: DatosCita          = DatosCita()
 
 
 
 @router.get("")
 async def listar_citas(
-    estado:     Optional[str] = None,
-    mascota_id: Optional[int] = None,
+    estado:         Optional[str] = None,
+    mascota_id:     Optional[int] = None,
+    limite:         int = Query(50, ge=1, le=200),
+    desplazamiento: int = Query(0, ge=0),
     db=Depends(get_db)
 ):
     """
-    Devuelve todas las citas con información de la mascota y el dueño.
+    Devuelve las citas paginadas, con información de la mascota y el dueño.
 
     Parámetros opcionales:
         ?estado=programada    →  solo citas programadas
         ?mascota_id=2         →  solo citas de esa mascota
+        ?limite=20            →  tamaño de página (máx. 200)
+        ?desplazamiento=20    →  cuántas citas saltar (para la página siguiente)
 
     Estados: programada, completada, cancelada, no_asistio
 
+    La respuesta incluye "siguiente_desplazamiento" con el valor a usar
+    para pedir la página siguiente, o null si ya no hay más.
+
     Ejemplos:
         GET /citas
         GET /citas?estado=programada
-        GET /citas?mascota_id=1
+        GET /citas?mascota_id=1&limite=20&desplazamiento=20
     """
+    # Elegir la variante preparada que corresponde a los filtros
+    if estado and mascota_id:
+        clave, parametros = "citas_estado_mascota", [estado, mascota_id]
+    elif estado:
+        clave, parametros = "citas_estado", [estado]
+    elif mascota_id:
+        clave, parametros = "citas_mascota", [mascota_id]
+    else:
+        clave, parametros = "citas_todas", []
+
+    # Pedir una fila de más para saber si existe otra página
+    parametros += [limite + 1, desplazamiento]
+
     async with db.acquire() as conn:
+        filas = await conn.consultas[clave].fetch(*parametros)
 
-        consulta = """
-            SELECT
-                c.*,
-                m.nombre   AS nombre_mascota,
-                m.especie,
-                d.nombre   AS nombre_dueno,
-                d.telefono AS telefono_dueno
-            FROM citas c
-            JOIN mascotas m ON m.id = c.mascota_id
-            JOIN duenos   d ON d.id = c.dueno_id
-            WHERE 1=1
-        """
-        parametros = []
-        contador   = 1
-
-        if estado:
-            consulta += f" AND c.estado = ${contador}"
-            parametros.append(estado)
-            contador += 1
-
-        if mascota_id:
-            consulta += f" AND c.mascota_id = ${contador}"
-            parametros.append(mascota_id)
-            contador += 1
-
-        consulta += " ORDER BY c.fecha_hora ASC"
-        filas = await conn.fetch(consulta, *parametros)
-
-    return lista_a_dicts(filas)
+    hay_mas = len(filas) > limite
+    return {
+        "items": lista_a_dicts(filas[:limite]),
+        "siguiente_desplazamiento": desplazamiento + limite if hay_mas else None,
+    }
+
+
+# Caché en memoria para la agenda de hoy: el dashboard la pide en bucle
+# pero cambia poco. Cada worker tiene su copia; 15 s de desfase es aceptable.
+TTL_CITAS_HOY = 15  # segundos
+_cache_hoy = {"datos": None, "caduca": 0.0}
 
 
 @router.get("/hoy")
-async def citas_de_hoy(db=Depends(get_db)):
+async def citas_de_hoy(response: Response, db=Depends(get_db)):
     """
     Devuelve solo las citas del día de hoy.
     Útil para la agenda diaria del dashboard.
+    El resultado se cachea 15 segundos (ver TTL_CITAS_HOY).
 
     Ejemplo:
         GET /citas/hoy
     """
+    # El navegador también puede reutilizar la respuesta este tiempo
+    response.headers["Cache-Control"] = f"max-age={TTL_CITAS_HOY}"
+
+    ahora = time.monotonic()
+    if _cache_hoy["datos"] is not None and ahora < _cache_hoy["caduca"]:
+        return _cache_hoy["datos"]
+
     async with db.acquire() as conn:
-        filas = await conn.fetch(
-            """
-            SELECT
-                c.*,
-                m.nombre   AS nombre_mascota,
-                m.especie,
-                d.nombre   AS nombre_dueno,
-                d.telefono AS telefono_dueno
-            FROM citas c
-            JOIN mascotas m ON m.id = c.mascota_id
-            JOIN duenos   d ON d.id = c.dueno_id
-            WHERE DATE(c.fecha_hora) = CURRENT_DATE
-            ORDER BY c.fecha_hora ASC
-            """
-        )
-    return lista_a_dicts(filas)
+        filas = await conn.consultas["citas_hoy"].fetch()
+
+    resultado = lista_a_dicts(filas)
+
+    _cache_hoy["datos"]  = resultado
+    _cache_hoy["caduca"] = ahora + TTL_CITAS_HOY
+
+    return resultado
 
 
 @router.post("", status_code=201)
@@ -144,31 +186,71 @@ async def crear_cita(datos: CrearCita, db=Depends(get_db)):
     }
     """
     async with db.acquire() as conn:
+        try:
+            # No hace falta comprobar antes que la mascota existe:
+            # la clave foránea ya lo garantiza, así ahorramos un viaje a la BD
+            fila = await conn.fetchrow(
+                """
+                INSERT INTO citas
+                    (mascota_id, dueno_id, fecha_hora, motivo, notas, datos_cita)
+                VALUES
+                    ($1, $2, $3, $4, $5, $6)
+                RETURNING *
+                """,
+                datos.mascota_id,
+                datos.dueno_id,
+                datos.fecha_hora,
+                datos.motivo,
+                datos.notas,
+                datos.datos_cita.model_dump()
+            )
+
+        except asyncpg.ForeignKeyViolationError as error:
+            # El nombre de la constraint nos dice qué referencia falló
+            if "mascota" in (error.constraint_name or ""):
+                raise HTTPException(status_code=404, detail="La mascota no existe")
+            raise HTTPException(status_code=404, detail="El dueño no existe")
 
-        # Verificar que la mascota existe
-        mascota = await conn.fetchrow(
-            "SELECT id FROM mascotas WHERE id = $1", datos.mascota_id
-        )
-        if not mascota:
-            raise HTTPException(status_code=404, detail="La mascota no existe")
+    return fila_a_dict(fila)
 
-        fila = await conn.fetchrow(
-            """
-            INSERT INTO citas
-                (mascota_id, dueno_id, fecha_hora, motivo, notas, datos_cita)
-            VALUES
-                ($1, $2, $3, $4, $5, $6::jsonb)
-            RETURNING *
-            """,
-            datos.mascota_id,
-            datos.dueno_id,
-            datos.fecha_hora,
-            datos.motivo,
-            datos.notas,
-            json.dumps(datos.datos_cita.model_dump())
-        )
 
-    return fila_a_dict(fila)
+@router.post("/lote", status_code=201)
+async def crear_citas_en_lote(
+    # Máximo 500 citas por petición: lotes más grandes, en varias llamadas
+    datos: Annotated[List[CrearCita], Field(max_length=500)],
+    db=Depends(get_db)
+):
+    """
+    Crea varias citas de una sola vez.
+
+    En vez de un INSERT por cita, usa el protocolo COPY de Postgres
+    (copy_records_to_table): todas las filas viajan en un único stream,
+    muchísimo más rápido que N viajes de ida y vuelta.
+
+    Body: una lista JSON de citas, cada una con el mismo formato
+    que en POST /citas.
+    """
+    registros = [
+        (d.mascota_id, d.dueno_id, d.fecha_hora, d.motivo, d.notas,
+         d.datos_cita.model_dump())
+        for d in datos
+    ]
+
+    async with db.acquire() as conn:
+        try:
+            await conn.copy_records_to_table(
+                "citas",
+                records=registros,
+                columns=("mascota_id", "dueno_id", "fecha_hora",
+                         "motivo", "notas", "datos_cita"),
+            )
+        except asyncpg.ForeignKeyViolationError as error:
+            # COPY es atómico: si una fila falla, no se inserta ninguna
+            if "mascota" in (error.constraint_name or ""):
+                raise HTTPException(status_code=404, detail="Alguna de las mascotas no existe")
+            raise HTTPException(status_code=404, detail="Alguno de los dueños no existe")
+
+    return {"insertadas": len(registros)}
 
 
 @router.patch("/{cita_id}/estado")
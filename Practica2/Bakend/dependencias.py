@@ -1,18 +1,12 @@
-# El pool se asigna desde main.py cuando arranca el servidor
-# (se hace así para evitar importaciones circulares)
-_pool = None
+from fastapi import Request
 
 
-def set_pool(pool):
-    """Lo llama main.py una vez que la base de datos está conectada."""
-    global _pool
-    _pool = pool
-
-
-def get_db():
+def get_db(request: Request):
     """
-    Devuelve el pool de conexiones.
-    FastAPI lo llama automáticamente en cada petición
-    gracias a Depends(get_db).
+    Devuelve el pool de conexiones guardado en app.state.
+    FastAPI lo llama automáticamente en cada petición gracias a
+    Depends(get_db). Al vivir en app.state (y no en un global mutable
+    de módulo) no hay que "registrar" nada aquí al arrancar: main.py
+    lo asigna una vez y esto queda en un simple acceso a atributo.
     """
-    return _pool
+    return request.app.state.pool
@@ -1,10 +1,10 @@
-import json
+import asyncio
 import asyncpg
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, ConfigDict
 from typing import Optional
 
-from funciones     import fila_a_dict, lista_a_dicts
+from funciones     import fila_a_dict, lista_a_dicts, Texto64, Texto200, Texto500
 from dependencias  import get_db
 
 router = APIRouter(
@@ -12,51 +12,96 @@ router = APIRouter(
     tags=["Dueños"]
 )
 
+# Variantes canónicas del listado (con y sin búsqueda / cursor).
+# Strings fijos que BBDD_vete prepara una vez por conexión del pool.
+CONSULTAS_DUENOS = {
+    "duenos_todos":
+        "SELECT * FROM duenos ORDER BY id DESC LIMIT $1",
+    "duenos_buscar":
+        "SELECT * FROM duenos WHERE (nombre ILIKE $1 OR email ILIKE $1)"
+        " ORDER BY id DESC LIMIT $2",
+
+    # Variantes con cursor: "id < cursor" salta directo a la página
+    # siguiente usando el índice, sin el coste de OFFSET de descartar filas
+    "duenos_todos_cursor":
+        "SELECT * FROM duenos WHERE id < $1 ORDER BY id DESC LIMIT $2",
+    "duenos_buscar_cursor":
+        "SELECT * FROM duenos WHERE (nombre ILIKE $1 OR email ILIKE $1)"
+        " AND id < $2 ORDER BY id DESC LIMIT $3",
+}
+
 
 class InfoContacto(BaseModel):
     """
     Datos de contacto extra del dueño.
     Se guarda como JSONB en la base de datos.
     """
-    contacto_preferido:  Optional[str] = "telefono"  # telefono | email | whatsapp
-    telefono_emergencia: Optional[str] = None
-    notas:               Optional[str] = None
+    # defer_build=False: compilar el validador al importar, no en la 1ª petición
+    # extra="forbid": rechazar campos desconocidos en vez de ignorarlos
+    model_config = ConfigDict(defer_build=False, extra="forbid")
+
+    contacto_preferido:  Optional[Texto64]  = "telefono"  # telefono | email | whatsapp
+    telefono_emergencia: Optional[Texto64]  = None
+    notas:               Optional[Texto500] = None
 
 
 class CrearDueno(BaseModel):
     """Datos necesarios para crear un dueño."""
-    nombre:        str
-    email:         str
-    telefono:      Optional[str]  = None
-    direccion:     Optional[str]  = None
+    model_config = ConfigDict(defer_build=False, extra="forbid")
+
+    nombre:        Texto200
+    email:         Texto200
+    telefono:      Optional[Texto64]  = None
+    direccion:     Optional[Texto200] = None
     info_contacto: InfoContacto   = InfoContacto()
 
 
 
 @router.get("")
-async def listar_duenos(buscar: Optional[str] = None, db=Depends(get_db)):
+async def listar_duenos(
+    buscar: Optional[str] = None,
+    limite: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = None,
+    db=Depends(get_db)
+):
     """
-    Devuelve la lista de todos los dueños.
+    Devuelve la lista de dueños, paginada por cursor.
 
     Parámetros opcionales:
         ?buscar=Ana  →  filtra por nombre o email que contengan "Ana"
+                        (ILIKE: sin distinción de mayúsculas)
+        ?limite=20   →  tamaño de página (máx. 200)
+        ?cursor=42   →  seguir a partir del id devuelto en
+                        "siguiente_cursor" de la página anterior
 
     Ejemplos:
         GET /duenos
         GET /duenos?buscar=garcia
+        GET /duenos?limite=20&cursor=42
     """
+    # Elegir la variante preparada que corresponde a los filtros
+    if buscar:
+        clave, parametros = "duenos_buscar", [f"%{buscar}%"]
+    else:
+        clave, parametros = "duenos_todos", []
+
+    if cursor is not None:
+        clave += "_cursor"
+        parametros.append(cursor)
+
+    # Pedir una fila de más para saber si existe otra página
+    parametros.append(limite + 1)
+
     async with db.acquire() as conn:
-        if buscar:
-            # ILIKE = búsqueda sin distinción de mayúsculas
-            # Los % permiten encontrar el texto en cualquier posición
-            filas = await conn.fetch(
-                "SELECT * FROM duenos WHERE nombre ILIKE $1 OR email ILIKE $1 ORDER BY id DESC",
-                f"%{buscar}%"
-            )
-        else:
-            filas = await conn.fetch("SELECT * FROM duenos ORDER BY id DESC")
+        filas = await conn.consultas[clave].fetch(*parametros)
+
+    hay_mas = len(filas) > limite
+    filas   = filas[:limite]
 
-    return lista_a_dicts(filas)
+    return {
+        "items": lista_a_dicts(filas),
+        "siguiente_cursor": filas[-1]["id"] if hay_mas else None,
+    }
 
 
 @router.post("", status_code=201)
@@ -80,15 +125,16 @@ async def crear_dueno(datos: CrearDueno, db=Depends(get_db)):
             fila = await conn.fetchrow(
                 """
                 INSERT INTO duenos (nombre, email, telefono, direccion, info_contacto)
-                VALUES ($1, $2, $3, $4, $5::jsonb)
+                VALUES ($1, $2, $3, $4, $5)
                 RETURNING *
                 """,
                 datos.nombre,
                 datos.email,
                 datos.telefono,
                 datos.direccion,
-                # model_dump() → dict de Python, json.dumps() → texto JSON para Postgres
-                json.dumps(datos.info_contacto.model_dump())
+                # model_dump() → dict de Python; el códec JSONB del pool
+                # se encarga de convertirlo para Postgres
+                datos.info_contacto.model_dump()
             )
             return fila_a_dict(fila)
 
@@ -108,20 +154,19 @@ async def ver_dueno(dueno_id: int, db=Depends(get_db)):
     Ejemplo:
         GET /duenos/1
     """
-    async with db.acquire() as conn:
-
-        dueno = await conn.fetchrow(
-            "SELECT * FROM duenos WHERE id = $1", dueno_id
-        )
-        if not dueno:
-            raise HTTPException(status_code=404, detail="Dueño no encontrado")
-
-        mascotas = await conn.fetch(
-            "SELECT * FROM mascotas WHERE dueno_id = $1 ORDER BY id", dueno_id
-        )
-
-        resultado             = fila_a_dict(dueno)
-        resultado["mascotas"] = lista_a_dicts(mascotas)
+    # Las dos consultas son independientes: lanzarlas a la vez con
+    # asyncio.gather (cada una usa su propia conexión del pool) evita
+    # esperar a una para empezar la otra
+    dueno, mascotas = await asyncio.gather(
+        db.fetchrow("SELECT * FROM duenos WHERE id = $1", dueno_id),
+        db.fetch("SELECT * FROM mascotas WHERE dueno_id = $1 ORDER BY id", dueno_id),
+    )
+
+    if not dueno:
+        raise HTTPException(status_code=404, detail="Dueño no encontrado")
+
+    resultado             = fila_a_dict(dueno)
+    resultado["mascotas"] = lista_a_dicts(mascotas)
 
     return resultado
 
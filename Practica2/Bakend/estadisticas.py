@@ -1,4 +1,6 @@
-from fastapi import APIRouter, Depends
+import time
+
+from fastapi import APIRouter, Depends, Response
 from dependencias import get_db
 
 router = APIRouter(
@@ -6,11 +8,55 @@ router = APIRouter(
     tags=["Dashboard"]
 )
 
+# Caché en memoria con caducidad corta: el dashboard se consulta mucho
+# (los frontends suelen refrescarlo en bucle) pero sus números cambian
+# despacio, así que la mayoría de peticiones ni tocan la base de datos.
+# Cada worker tiene su propia copia; 15 s de desfase máximo es aceptable.
+TTL_ESTADISTICAS = 15  # segundos
+_cache = {"datos": None, "caduca": 0.0}
+
+# Todos los números del dashboard en UNA sola consulta.
+# Cada CTE (WITH ... AS) calcula un contador por separado y el SELECT
+# final los junta, así solo pagamos un viaje de ida y vuelta a Postgres
+# en vez de seis.
+CONSULTA_ESTADISTICAS = """
+    WITH
+    td AS (SELECT COUNT(*) AS c FROM duenos),
+    tm AS (SELECT COUNT(*) AS c FROM mascotas),
+    tc AS (SELECT COUNT(*) AS c FROM citas),
+    ch AS (
+        -- Rango [hoy, mañana) en vez de DATE(fecha_hora) = hoy:
+        -- así Postgres puede usar el índice idx_citas_fecha
+        SELECT COUNT(*) AS c FROM citas
+        WHERE fecha_hora >= CURRENT_DATE
+          AND fecha_hora < CURRENT_DATE + INTERVAL '1 day'
+    ),
+    pr AS (
+        SELECT COUNT(*) AS c FROM citas
+        WHERE estado = 'programada' AND fecha_hora >= NOW()
+    ),
+    pe AS (
+        SELECT json_agg(x) AS j FROM (
+            SELECT especie, COUNT(*) AS total
+            FROM mascotas GROUP BY especie ORDER BY total DESC
+        ) x
+    )
+    SELECT
+        td.c AS total_duenos,
+        tm.c AS total_mascotas,
+        tc.c AS total_citas,
+        ch.c AS citas_hoy,
+        pr.c AS proximas_citas,
+        pe.j AS mascotas_por_especie
+    FROM td, tm, tc, ch, pr, pe
+"""
+
 
 @router.get("")
-async def obtener_estadisticas(db=Depends(get_db)):
+async def obtener_estadisticas(response: Response, db=Depends(get_db)):
     """
     Devuelve un resumen con los números clave de la clínica.
+    El resultado se cachea 15 segundos (ver TTL_ESTADISTICAS).
 
     Respuesta de ejemplo:
     {
@@ -25,33 +71,24 @@ async def obtener_estadisticas(db=Depends(get_db)):
         ]
     }
     """
+    # El navegador también puede reutilizar la respuesta este tiempo
+    response.headers["Cache-Control"] = f"max-age={TTL_ESTADISTICAS}"
+
+    ahora = time.monotonic()
+    if _cache["datos"] is not None and ahora < _cache["caduca"]:
+        return _cache["datos"]
+
     async with db.acquire() as conn:
+        fila = await conn.fetchrow(CONSULTA_ESTADISTICAS)
 
-        # fetchval devuelve un único valor escalar (el resultado del COUNT)
-        total_duenos   = await conn.fetchval("SELECT COUNT(*) FROM duenos")
-        total_mascotas = await conn.fetchval("SELECT COUNT(*) FROM mascotas")
-        total_citas    = await conn.fetchval("SELECT COUNT(*) FROM citas")
-
-        # DATE() extrae solo la fecha (sin la hora) para comparar con hoy
-        citas_hoy = await conn.fetchval(
-            "SELECT COUNT(*) FROM citas WHERE DATE(fecha_hora) = CURRENT_DATE"
-        )
-
-        # Citas que están programadas y aún no han pasado
-        proximas = await conn.fetchval(
-            "SELECT COUNT(*) FROM citas WHERE estado = 'programada' AND fecha_hora >= NOW()"
-        )
-
-        # Cuántas mascotas hay de cada especie, de más a menos
-        por_especie = await conn.fetch(
-            "SELECT especie, COUNT(*) AS total FROM mascotas GROUP BY especie ORDER BY total DESC"
-        )
-
-    return {
-        "total_duenos":         total_duenos,
-        "total_mascotas":       total_mascotas,
-        "total_citas":          total_citas,
-        "citas_hoy":            citas_hoy,
-        "proximas_citas":       proximas,
-        "mascotas_por_especie": [dict(r) for r in por_especie]
-    }
+    resultado = dict(fila)
+
+    # El códec JSON del pool ya decodifica json_agg a una lista de dicts;
+    # solo queda cubrir el NULL cuando aún no hay mascotas
+    if resultado["mascotas_por_especie"] is None:
+        resultado["mascotas_por_especie"] = []
+
+    _cache["datos"]  = resultado
+    _cache["caduca"] = ahora + TTL_ESTADISTICAS
+
+    return resultado
@@ -1,4 +1,13 @@
-from datetime import datetime, date
+from typing import Annotated
+
+from pydantic import StringConstraints
+
+# Tipos de texto con tope de longitud para los modelos Pydantic.
+# Evitan que un cliente (con errores, o malicioso) meta megabytes en los
+# campos JSONB: eso engordaría los índices GIN y encarecería cada lectura.
+Texto64  = Annotated[str, StringConstraints(max_length=64)]    # tokens cortos
+Texto200 = Annotated[str, StringConstraints(max_length=200)]   # nombres, emails...
+Texto500 = Annotated[str, StringConstraints(max_length=500)]   # notas y textos libres
 
 
 def fila_a_dict(fila) -> dict | None:
@@ -6,12 +15,13 @@ def fila_a_dict(fila) -> dict | None:
     Convierte una fila de PostgreSQL a un diccionario Python normal.
 
     El problema es que asyncpg devuelve un tipo especial (Record),
-    no un dict normal. Además, las fechas hay que convertirlas a texto
-    para que el frontend las pueda leer en formato JSON.
+    no un dict normal. Las fechas ya no hay que tocarlas: la app usa
+    ORJSONResponse y orjson serializa datetime/date a ISO 8601 por su
+    cuenta (y a velocidad de C).
 
     Ejemplo:
         fila = <Record id=1 nombre='Ana' creado_en=datetime(2025,1,1)>
-        fila_a_dict(fila) → {"id": 1, "nombre": "Ana", "creado_en": "2025-01-01T00:00:00"}
+        fila_a_dict(fila) → {"id": 1, "nombre": "Ana", "creado_en": datetime(2025,1,1)}
 
     Parámetros:
         fila: una fila de asyncpg (o None si no se encontró el registro)
@@ -19,18 +29,7 @@ def fila_a_dict(fila) -> dict | None:
     Devuelve:
         Un dict con todos los campos, o None si la fila era None
     """
-    if fila is None:
-        return None
-
-    resultado = dict(fila)
-
-    # Recorrer todos los campos y convertir fechas a texto ISO 8601
-    # ISO 8601 es el formato estándar: "2025-03-15" o "2025-03-15T10:30:00"
-    for clave, valor in resultado.items():
-        if isinstance(valor, (datetime, date)):
-            resultado[clave] = valor.isoformat()
-
-    return resultado
+    return dict(fila) if fila is not None else None
 
 
 def lista_a_dicts(filas: list) -> list[dict]:
@@ -38,10 +37,10 @@ def lista_a_dicts(filas: list) -> list[dict]:
     Convierte una lista de filas de PostgreSQL a una lista de dicts.
 
     Es un atajo para no escribir el bucle en cada sitio:
-        [fila_a_dict(f) for f in filas]
+        [dict(f) for f in filas]
 
     Ejemplo:
         filas = [<Record id=1>, <Record id=2>]
         lista_a_dicts(filas) → [{"id": 1}, {"id": 2}]
     """
-    return [fila_a_dict(f) for f in filas]
+    return [dict(f) for f in filas]
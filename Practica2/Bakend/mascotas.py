@@ -1,10 +1,12 @@
-import json
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import Optional, List
+import asyncio
+import asyncpg
+from itertools import combinations
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Annotated, Optional, List
 from datetime import date
 
-from funciones     import fila_a_dict, lista_a_dicts
+from funciones     import fila_a_dict, lista_a_dicts, Texto64, Texto200, Texto500
 from dependencias  import get_db
 
 router = APIRouter(
@@ -12,6 +14,47 @@ router = APIRouter(
     tags=["Mascotas"]
 )
 
+# SELECT base del listado: mascota + nombre del dueño
+_SELECT_MASCOTAS = """
+    SELECT m.*, d.nombre AS nombre_dueno
+    FROM mascotas m
+    JOIN duenos d ON d.id = m.dueno_id
+"""
+
+# Variantes canónicas del listado. Al ser strings fijos (en vez de
+# construirlos por petición), BBDD_vete las prepara UNA vez por conexión
+# del pool y los handlers reutilizan el plan ya parseado.
+CONSULTAS_MASCOTAS = {
+    "mascotas_todas":         _SELECT_MASCOTAS + " ORDER BY m.id DESC LIMIT $1",
+    "mascotas_especie":       _SELECT_MASCOTAS + " WHERE m.especie ILIKE $1 ORDER BY m.id DESC LIMIT $2",
+    "mascotas_dueno":         _SELECT_MASCOTAS + " WHERE m.dueno_id = $1 ORDER BY m.id DESC LIMIT $2",
+    "mascotas_especie_dueno": _SELECT_MASCOTAS + " WHERE m.especie ILIKE $1 AND m.dueno_id = $2 ORDER BY m.id DESC LIMIT $3",
+
+    # Variantes con cursor: "id < cursor" salta directo a la página
+    # siguiente usando el índice, sin el coste de OFFSET de descartar filas
+    "mascotas_todas_cursor":         _SELECT_MASCOTAS + " WHERE m.id < $1 ORDER BY m.id DESC LIMIT $2",
+    "mascotas_especie_cursor":       _SELECT_MASCOTAS + " WHERE m.especie ILIKE $1 AND m.id < $2 ORDER BY m.id DESC LIMIT $3",
+    "mascotas_dueno_cursor":         _SELECT_MASCOTAS + " WHERE m.dueno_id = $1 AND m.id < $2 ORDER BY m.id DESC LIMIT $3",
+    "mascotas_especie_dueno_cursor": _SELECT_MASCOTAS + " WHERE m.especie ILIKE $1 AND m.dueno_id = $2 AND m.id < $3 ORDER BY m.id DESC LIMIT $4",
+}
+
+# Campos que el PATCH puede modificar (lista blanca contra SQL injection)
+CAMPOS_ACTUALIZABLES = ("nombre", "raza", "fecha_nac", "peso_kg", "info_medica")
+
+# Una plantilla de UPDATE por cada combinación posible de campos (31 en
+# total), generadas una vez al importar el módulo. Así el handler no
+# concatena SQL por petición y Postgres siempre ve los mismos strings.
+# Cada entrada guarda (orden de los campos, SQL) para pasar los valores
+# en el orden correcto.
+_PLANTILLAS_UPDATE = {}
+for _n in range(1, len(CAMPOS_ACTUALIZABLES) + 1):
+    for _combo in combinations(CAMPOS_ACTUALIZABLES, _n):
+        _partes = ", ".join(f"{campo} = ${i}" for i, campo in enumerate(_combo, start=1))
+        _PLANTILLAS_UPDATE[frozenset(_combo)] = (
+            _combo,
+            f"UPDATE mascotas SET {_partes} WHERE id = ${len(_combo) + 1} RETURNING *",
+        )
+
 
 
 class InfoMedica(BaseModel):
@@ -20,23 +63,29 @@ class InfoMedica(BaseModel):
     Se guarda como JSONB: estructura flexible que no
     requiere cambios en la tabla para añadir nuevos campos.
     """
-    alergias:     Optional[List[str]] = []    # Ej: ["penicilina", "ácaros"]
-    condiciones:  Optional[List[str]] = []    # Enfermedades crónicas
-    vacunas:      Optional[List[str]] = []    # Vacunas puestas
-    microchip:    Optional[str]       = None  # ID del microchip
-    esterilizado: Optional[bool]      = None  # True/False/None (no se sabe)
-    notas:        Optional[str]       = None  # Observaciones del vet
+    # defer_build=False: compilar el validador al importar, no en la 1ª petición
+    # extra="forbid": rechazar campos desconocidos en vez de ignorarlos
+    model_config = ConfigDict(defer_build=False, extra="forbid")
+
+    alergias:     Optional[List[Texto64]] = Field([], max_length=32)  # Ej: ["penicilina", "ácaros"]
+    condiciones:  Optional[List[Texto64]] = Field([], max_length=32)  # Enfermedades crónicas
+    vacunas:      Optional[List[Texto64]] = Field([], max_length=32)  # Vacunas puestas
+    microchip:    Optional[Texto64]       = None  # ID del microchip
+    esterilizado: Optional[bool]          = None  # True/False/None (no se sabe)
+    notas:        Optional[Texto500]      = None  # Observaciones del vet
 
 
 class CrearMascota(BaseModel):
     """Datos necesarios para registrar una mascota."""
+    model_config = ConfigDict(defer_build=False, extra="forbid")
+
     dueno_id:    int
-    nombre:      str
-    especie:     str                    # perro, gato, ave, conejo, reptil, otro
-    raza:        Optional[str]   = None
-    fecha_nac:   Optional[date]  = None
-    peso_kg:     Optional[float] = None
-    info_medica: InfoMedica      = InfoMedica()
+    nombre:      Texto200
+    especie:     Texto64                   # perro, gato, ave, conejo, reptil, otro
+    raza:        Optional[Texto200] = None
+    fecha_nac:   Optional[date]     = None
+    peso_kg:     Optional[float]    = None
+    info_medica: InfoMedica         = InfoMedica()
 
 
 
@@ -44,46 +93,52 @@ class CrearMascota(BaseModel):
 async def listar_mascotas(
     especie:  Optional[str] = None,
     dueno_id: Optional[int] = None,
+    limite:   int = Query(50, ge=1, le=200),
+    cursor:   Optional[int] = None,
     db=Depends(get_db)
 ):
     """
-    Devuelve todas las mascotas registradas.
+    Devuelve las mascotas registradas, paginadas por cursor.
 
     Parámetros opcionales:
         ?especie=gato      →  solo gatos
         ?dueno_id=3        →  solo las mascotas del dueño 3
+        ?limite=20         →  tamaño de página (máx. 200)
+        ?cursor=42         →  seguir a partir del id devuelto en
+                              "siguiente_cursor" de la página anterior
 
     Ejemplos:
         GET /mascotas
         GET /mascotas?especie=perro
-        GET /mascotas?dueno_id=2
+        GET /mascotas?dueno_id=2&limite=20&cursor=42
     """
-    async with db.acquire() as conn:
+    # Elegir la variante preparada que corresponde a los filtros
+    if especie and dueno_id:
+        clave, parametros = "mascotas_especie_dueno", [f"%{especie}%", dueno_id]
+    elif especie:
+        clave, parametros = "mascotas_especie", [f"%{especie}%"]
+    elif dueno_id:
+        clave, parametros = "mascotas_dueno", [dueno_id]
+    else:
+        clave, parametros = "mascotas_todas", []
+
+    if cursor is not None:
+        clave += "_cursor"
+        parametros.append(cursor)
+
+    # Pedir una fila de más para saber si existe otra página
+    parametros.append(limite + 1)
 
-        # JOIN para incluir el nombre del dueño en la respuesta
-        consulta = """
-            SELECT m.*, d.nombre AS nombre_dueno
-            FROM mascotas m
-            JOIN duenos d ON d.id = m.dueno_id
-            WHERE 1=1
-        """
-        parametros = []
-        contador   = 1
-
-        if especie:
-            consulta += f" AND m.especie ILIKE ${contador}"
-            parametros.append(f"%{especie}%")
-            contador += 1
-
-        if dueno_id:
-            consulta += f" AND m.dueno_id = ${contador}"
-            parametros.append(dueno_id)
-            contador += 1
+    async with db.acquire() as conn:
+        filas = await conn.consultas[clave].fetch(*parametros)
 
-        consulta += " ORDER BY m.id DESC"
-        filas = await conn.fetch(consulta, *parametros)
+    hay_mas = len(filas) > limite
+    filas   = filas[:limite]
 
-    return lista_a_dicts(filas)
+    return {
+        "items": lista_a_dicts(filas),
+        "siguiente_cursor": filas[-1]["id"] if hay_mas else None,
+    }
 
 
 @router.post("", status_code=201)
@@ -106,34 +161,69 @@ async def crear_mascota(datos: CrearMascota, db=Depends(get_db)):
     }
     """
     async with db.acquire() as conn:
-
-        # Verificar que el dueño existe antes de crear la mascota
-        dueno = await conn.fetchrow(
-            "SELECT id FROM duenos WHERE id = $1", datos.dueno_id
-        )
-        if not dueno:
+        try:
+            # No hace falta comprobar antes que el dueño existe:
+            # la clave foránea ya lo garantiza, así ahorramos un viaje a la BD
+            fila = await conn.fetchrow(
+                """
+                INSERT INTO mascotas
+                    (dueno_id, nombre, especie, raza, fecha_nac, peso_kg, info_medica)
+                VALUES
+                    ($1, $2, $3, $4, $5, $6, $7)
+                RETURNING *
+                """,
+                datos.dueno_id,
+                datos.nombre,
+                datos.especie,
+                datos.raza,
+                datos.fecha_nac,
+                datos.peso_kg,
+                datos.info_medica.model_dump()
+            )
+
+        except asyncpg.ForeignKeyViolationError:
             raise HTTPException(status_code=404, detail="El dueño especificado no existe")
 
-        fila = await conn.fetchrow(
-            """
-            INSERT INTO mascotas
-                (dueno_id, nombre, especie, raza, fecha_nac, peso_kg, info_medica)
-            VALUES
-                ($1, $2, $3, $4, $5, $6, $7::jsonb)
-            RETURNING *
-            """,
-            datos.dueno_id,
-            datos.nombre,
-            datos.especie,
-            datos.raza,
-            datos.fecha_nac,
-            datos.peso_kg,
-            json.dumps(datos.info_medica.model_dump())
-        )
-
     return fila_a_dict(fila)
 
 
+@router.post("/lote", status_code=201)
+async def crear_mascotas_en_lote(
+    # Máximo 500 mascotas por petición: lotes más grandes, en varias llamadas
+    datos: Annotated[List[CrearMascota], Field(max_length=500)],
+    db=Depends(get_db)
+):
+    """
+    Registra varias mascotas de una sola vez.
+
+    En vez de un INSERT por mascota, usa el protocolo COPY de Postgres
+    (copy_records_to_table): todas las filas viajan en un único stream,
+    muchísimo más rápido que N viajes de ida y vuelta.
+
+    Body: una lista JSON de mascotas, cada una con el mismo formato
+    que en POST /mascotas.
+    """
+    registros = [
+        (d.dueno_id, d.nombre, d.especie, d.raza, d.fecha_nac, d.peso_kg,
+         d.info_medica.model_dump())
+        for d in datos
+    ]
+
+    async with db.acquire() as conn:
+        try:
+            await conn.copy_records_to_table(
+                "mascotas",
+                records=registros,
+                columns=("dueno_id", "nombre", "especie", "raza",
+                         "fecha_nac", "peso_kg", "info_medica"),
+            )
+        except asyncpg.ForeignKeyViolationError:
+            # COPY es atómico: si una fila falla, no se inserta ninguna
+            raise HTTPException(status_code=404, detail="Alguno de los dueños no existe")
+
+    return {"insertadas": len(registros)}
+
+
 @router.get("/{mascota_id}")
 async def ver_mascota(mascota_id: int, db=Depends(get_db)):
     """
@@ -142,9 +232,11 @@ async def ver_mascota(mascota_id: int, db=Depends(get_db)):
     Ejemplo:
         GET /mascotas/1
     """
-    async with db.acquire() as conn:
-
-        mascota = await conn.fetchrow(
+    # Las dos consultas son independientes: lanzarlas a la vez con
+    # asyncio.gather (cada una usa su propia conexión del pool) evita
+    # esperar a una para empezar la otra
+    mascota, citas = await asyncio.gather(
+        db.fetchrow(
             """
             SELECT m.*, d.nombre AS nombre_dueno, d.telefono AS telefono_dueno
             FROM mascotas m
@@ -152,18 +244,19 @@ async def ver_mascota(mascota_id: int, db=Depends(get_db)):
             WHERE m.id = $1
             """,
             mascota_id
-        )
-        if not mascota:
-            raise HTTPException(status_code=404, detail="Mascota no encontrada")
-
+        ),
         # Historial de citas (las más recientes primero)
-        citas = await conn.fetch(
+        db.fetch(
             "SELECT * FROM citas WHERE mascota_id = $1 ORDER BY fecha_hora DESC",
             mascota_id
-        )
+        ),
+    )
+
+    if not mascota:
+        raise HTTPException(status_code=404, detail="Mascota no encontrada")
 
-        resultado                   = fila_a_dict(mascota)
-        resultado["historial_citas"] = lista_a_dicts(citas)
+    resultado                    = fila_a_dict(mascota)
+    resultado["historial_citas"] = lista_a_dicts(citas)
 
     return resultado
 
@@ -185,40 +278,30 @@ async def actualizar_mascota(mascota_id: int, datos: dict, db=Depends(get_db)):
             PATCH /mascotas/1
             Body: { "info_medica": { "alergias": ["penicilina"] } }
     """
-    async with db.acquire() as conn:
-
-        mascota = await conn.fetchrow(
-            "SELECT * FROM mascotas WHERE id = $1", mascota_id
-        )
-        if not mascota:
-            raise HTTPException(status_code=404, detail="Mascota no encontrada")
+    # Quedarse solo con los campos de la lista blanca
+    campos = {k: v for k, v in datos.items() if k in CAMPOS_ACTUALIZABLES}
 
-        # Solo permitir actualizar estos campos (evitar SQL injection)
-        campos_permitidos = {"nombre", "raza", "fecha_nac", "peso_kg", "info_medica"}
-        campos = {k: v for k, v in datos.items() if k in campos_permitidos}
+    async with db.acquire() as conn:
 
         if not campos:
-            return fila_a_dict(mascota)  # Nada que cambiar
-
-        # Construir "nombre = $1, peso_kg = $2" dinámicamente
-        partes  = []
-        valores = []
-        i = 1
-
-        for campo, valor in campos.items():
-            if campo == "info_medica":
-                partes.append(f"{campo} = ${i}::jsonb")  # Cast necesario para JSONB
-                valores.append(json.dumps(valor))
-            else:
-                partes.append(f"{campo} = ${i}")
-                valores.append(valor)
-            i += 1
-
+            # Nada que cambiar: devolver la fila tal cual está
+            mascota = await conn.fetchrow(
+                "SELECT * FROM mascotas WHERE id = $1", mascota_id
+            )
+            if not mascota:
+                raise HTTPException(status_code=404, detail="Mascota no encontrada")
+            return fila_a_dict(mascota)
+
+        # Plantilla precalculada para esta combinación de campos.
+        # El UPDATE ... RETURNING hace también de comprobación de existencia,
+        # así que no hay SELECT previo: un solo viaje a la base de datos.
+        orden, consulta = _PLANTILLAS_UPDATE[frozenset(campos)]
+        valores = [campos[campo] for campo in orden]
         valores.append(mascota_id)
-        fila = await conn.fetchrow(
-            f"UPDATE mascotas SET {', '.join(partes)} WHERE id = ${i} RETURNING *",
-            *valores
-        )
+
+        fila = await conn.fetchrow(consulta, *valores)
+        if not fila:
+            raise HTTPException(status_code=404, detail="Mascota no encontrada")
 
     return fila_a_dict(fila)
 